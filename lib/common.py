@@ -1,8 +1,34 @@
+import ast
+from collections import OrderedDict, deque
 from enum import Enum
+import itertools
+import hashlib
+import inspect
+import os
+import sys
+import tempfile
+import threading
+import types
 from typing import Dict
-from sympy import Expr, Float, parse_expr, lambdify
+import sympy
+from sympy import Basic, Expr, Float, parse_expr, lambdify, srepr
+from sympy.functions.elementary.piecewise import ExprCondPair
 import json
-from typing import Literal, List
+from typing import Literal, List, Tuple, Callable
+import numpy as np
+
+try:
+    from numba import njit, vectorize, float64
+except ImportError:
+    # Numba is optional : lambdified functions are then run as plain python
+    njit = None
+    vectorize = None
+
+try:
+    import symengine
+except ImportError:
+    # Symengine is optional : dict of expressions are then fused and compiled with numba
+    symengine = None
 
 class ParamType(str, Enum) :
     BOOLEAN = "bool"
@@ -12,29 +38,315 @@ class ParamType(str, Enum) :
 
 class FunctionalUnit :
 
+    __slots__ = ("quantity", "unit")
+
     def __init__(self, quantity, unit):
         self.quantity = quantity
         self.unit = unit
 
 def _lambdify(expr, expanded_params):
 
-    if isinstance(expr, Expr):
-        return lambdify(expanded_params, expr, 'numpy')
+    if isinstance(expr, (Expr, sympy.Tuple)):
+        # Extract common sub expressions as intermediate variables
+        return lambdify(expanded_params, expr, 'numpy', cse=True)
     else:
         # Not an expression : return statis func
         def static_func(*args, **kargs):
             return expr
         return static_func
 
+# Folder of generated sources of lambdified functions, and of their machine code cached by numba. Private to the user
+CACHE_DIR = os.environ.get("LAMBDA_CACHE_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser(os.path.join("~", ".cache")),
+    "lambda_cache")
+
+# Options of numba compilation. Fast math, except 'nnan' and 'ninf' flags : values may be inf / nan (division by zero)
+_FASTMATH_FLAGS = ('afn', 'arcp', 'contract', 'nsz', 'reassoc')
+_ERROR_MODEL = 'numpy'
+_JIT_OPTIONS = dict(fastmath=set(_FASTMATH_FLAGS), error_model=_ERROR_MODEL)
+
+def _private_cache_dir():
+    """Create CACHE_DIR if needed, readable by the current user only. Refuse it if others may write in it"""
+
+    os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+
+    stat = os.stat(CACHE_DIR)
+    if hasattr(os, "getuid") and stat.st_uid != os.getuid():
+        raise PermissionError("Cache dir %s is not owned by current user" % CACHE_DIR)
+    if stat.st_mode & 0o022:
+        raise PermissionError("Cache dir %s is writable by other users" % CACHE_DIR)
+
+    return CACHE_DIR
+
+def _to_source_file(func):
+    """
+    Write the source of a lambdified function into a real python module, and load it back from there.
+    Numba can only cache functions having a source file, which lambdified functions lack.
+    The file is rewritten if its content differs from the source, and the module is always built from the
+    source in memory : the content of the file is never executed
+    """
+    src = inspect.getsource(func)
+    cache_dir = _private_cache_dir()
+
+    # Numba does not check compilation options of cached code : they are part of the name of the file
+    key = src + repr((_FASTMATH_FLAGS, _ERROR_MODEL))
+    path = os.path.join(cache_dir, "lambd_%s.py" % hashlib.sha1(key.encode()).hexdigest())
+
+    try:
+        with open(path, "r") as f:
+            valid = f.read() == src
+    except FileNotFoundError:
+        valid = False
+
+    if not valid:
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(src)
+        os.replace(tmp_path, path)
+
+    module_name = os.path.basename(path)[:-3]
+    module = sys.modules.get(module_name)
+
+    if module is None:
+        module = types.ModuleType(module_name)
+        module.__file__ = path
+
+        # Same globals (numpy functions) as the lambdified function
+        module.__dict__.update({key: val for key, val in func.__globals__.items() if not key.startswith("__")})
+        exec(compile(src, path, "exec"), module.__dict__)
+
+        # Numba imports it back when loading cached machine code
+        sys.modules[module_name] = module
+
+    return getattr(module, func.__name__)
+
+def _with_numpy_floats(func):
+    """
+    Wrap a lambdified function to call it with numpy floats, as compiled functions are.
+    Divisions by zero then return inf / nan (with a warning) instead of raising ZeroDivisionError
+    """
+    def numpy_floats_func(*args):
+        return func(*(np.float64(arg) for arg in args))
+
+    # Python function, for arrays of values
+    numpy_floats_func.py_func = func
+    return numpy_floats_func
+
+def _jit(func, nargs):
+    """
+    Compile a lambdified function with numba, if available.
+    All arguments are typed as float64 and compiled eagerly : the cost is paid at load time,
+    and int / bool values are cast instead of triggering new compilations.
+    Divisions by zero return inf / nan as numpy does, on all paths, instead of raising ZeroDivisionError.
+    The machine code is cached on disk, in CACHE_DIR : next loads skip compilation.
+    Falls back to the python function, called with numpy floats, if numba is missing or fails to compile it.
+    """
+    if njit is None:
+        return _with_numpy_floats(func)
+    signature = (float64,) * nargs
+    try:
+        return njit(signature, cache=True, **_JIT_OPTIONS)(_to_source_file(func))
+    except Exception:
+        pass
+    try:
+        return njit(signature, cache=False, **_JIT_OPTIONS)(func)
+    except Exception:
+        return _with_numpy_floats(func)
+
+def _vectorize(func, nargs):
+    """
+    Build a numpy ufunc from a lambdified function, to evaluate it over arrays of values.
+    Returns None if numba is missing or fails to compile it.
+    Single threaded on purpose : parallel ufuncs abort (workqueue) or hang at exit (tbb) when called from several threads
+    """
+    if vectorize is None or nargs == 0:
+        return None
+    try:
+        return vectorize([float64(*(float64,) * nargs)], target='cpu')(getattr(func, "py_func", func))
+    except Exception:
+        return None
+
+# Compiled functions by (srepr of expression, positional params), shared by identical expressions across lambdas
+_COMPILED_CACHE: Dict[Tuple[str, Tuple[str, ...]], Callable] = dict()
+
+def _decimal_floats(expr):
+    """
+    Replace Floats by full precision Floats of their printed decimal value, as lambdify prints them.
+    Floats rounded to few digits (round_expr) otherwise keep their short binary mantissa : Float(7.777777, 3) is 7.77734375
+    """
+    floats = expr.atoms(Float)
+    if not floats:
+        return expr
+    return expr.xreplace({f: Float(str(f), 15) for f in floats})
+
+def _constant_value(expr):
+    """Float value of a numeric expression, or tuple of values for a Tuple of them. None otherwise"""
+    exprs = expr if isinstance(expr, sympy.Tuple) else [expr]
+    if not all(sub_expr.is_number for sub_expr in exprs):
+        return None
+    try:
+        values = tuple(float(_decimal_floats(sub_expr)) for sub_expr in exprs)
+    except TypeError:
+        # Complex
+        return None
+    return values if isinstance(expr, sympy.Tuple) else values[0]
+
+def _compile(expr, expanded_params):
+    """Lambdify and jit an expression (or Tuple of expressions), reusing the function already compiled for an identical one"""
+
+    if not isinstance(expr, (Expr, sympy.Tuple)):
+        return _lambdify(expr, expanded_params)
+
+    # Numeric constant(s) : no need to compile
+    value = _constant_value(expr)
+    if value is not None:
+        def constant_func(*args, **kargs):
+            return value
+        return constant_func
+
+    key = (srepr(expr), tuple(expanded_params))
+    func = _COMPILED_CACHE.get(key)
+    if func is None:
+        func = _jit(_lambdify(expr, expanded_params), len(expanded_params))
+        _COMPILED_CACHE[key] = func
+    return func
+
+def _se_lambdify(exprs, expanded_params):
+    """
+    Compile a list of expressions into a single LLVM function with symengine, returning the vector of their values.
+    Returns None if symengine is missing or fails to compile them.
+    """
+    if symengine is None:
+        return None
+    try:
+        return symengine.Lambdify(
+            [symengine.Symbol(name) for name in expanded_params],
+            # Symengine would compile the binary value of rounded Floats, not their decimal one as lambdify does
+            [symengine.sympify(_decimal_floats(expr)) for expr in exprs],
+            backend='llvm', real=True, cse=True)
+    except Exception:
+        return None
+
+# Nodes allowed in srepr form : sympy classes (no functions like sympify or lambdify) and constants.
+# Only core classes, elementary functions and logic : others, like factorial or number theory, may evaluate for ages
+_SREPR_MODULES = ("sympy.core.", "sympy.functions.elementary.", "sympy.logic.")
+_SREPR_CLASSES = {
+    name: obj for name, obj in vars(sympy).items()
+    if isinstance(obj, type) and issubclass(obj, Basic) and obj.__module__.startswith(_SREPR_MODULES)
+    and name not in ("Derivative", "Subs")}
+
+# Printed by srepr of Piecewise, but not exported by sympy
+_SREPR_CLASSES["ExprCondPair"] = ExprCondPair
+_SREPR_CONSTANTS = {
+    name: getattr(sympy, name)
+    for name in ("pi", "E", "I", "oo", "zoo", "nan", "true", "false", "EulerGamma", "GoldenRatio", "Catalan")}
+
+# Only those classes receive strings (names or digits). Others would sympify them, running them as code
+_SREPR_STR_CLASSES = {"Symbol", "Dummy", "Float", "Function"}
+
+# Bounds of the numbers of srepr expressions, as sympy computes exact values while building them
+_SREPR_MAX_INT = 10 ** 18
+_SREPR_MAX_PRECISION = 1024
+_SREPR_MAX_POW_BITS = 4096
+
+def _check_srepr_args(name, args, kwargs):
+    """Raise ValueError for numbers too costly to build"""
+
+    values = list(args) + list(kwargs.values())
+    if name == "Float" and any(isinstance(val, int) and val > _SREPR_MAX_PRECISION for val in values[1:]):
+        raise ValueError("Precision of Float too large : %s" % values[1:])
+
+    # Exact power of rationals
+    if name == "Pow" and len(args) == 2 and all(isinstance(arg, (int, sympy.Rational)) for arg in args):
+        base, exp = (sympy.Rational(arg) for arg in args)
+        if max(base.p.bit_length(), base.q.bit_length()) * abs(exp.p) > _SREPR_MAX_POW_BITS:
+            raise ValueError("Power too large : Pow(%s, %s)" % (base, exp))
+
+def _build_srepr(node, str_allowed=False):
+    """Build a sympy expression from the syntax tree of its srepr form, accepting only whitelisted nodes"""
+
+    if isinstance(node, ast.Constant) :
+        if type(node.value) is int and abs(node.value) > _SREPR_MAX_INT:
+            raise ValueError("Integer too large in srepr expression : %d" % node.value)
+        if type(node.value) in (int, float) or (str_allowed and isinstance(node.value, str)):
+            return node.value
+
+    elif isinstance(node, ast.UnaryOp) :
+        if isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant) and type(node.operand.value) in (int, float):
+            return -_build_srepr(node.operand)
+        # -oo
+        if isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Name):
+            return -_build_srepr(node.operand)
+
+    elif isinstance(node, ast.Name) :
+        if node.id in _SREPR_CONSTANTS:
+            return _SREPR_CONSTANTS[node.id]
+
+    elif isinstance(node, ast.Call) :
+        if isinstance(node.func, ast.Name) and node.func.id in _SREPR_CLASSES and all(kw.arg for kw in node.keywords):
+            name = node.func.id
+            str_allowed = name in _SREPR_STR_CLASSES
+            args = [_build_srepr(arg, str_allowed) for arg in node.args]
+            kwargs = {kw.arg: _build_srepr(kw.value) for kw in node.keywords}
+            _check_srepr_args(name, args, kwargs)
+            try:
+                return _SREPR_CLASSES[name](*args, **kwargs)
+            except Exception as e:
+                raise ValueError("Invalid arguments in srepr expression : %s" % ast.unparse(node)) from e
+
+        # Undefined function applied to its arguments : Function('f')(Symbol('x'))
+        if isinstance(node.func, ast.Call) and isinstance(node.func.func, ast.Name) and node.func.func.id == "Function" and not node.keywords:
+            func = _build_srepr(node.func)
+            args = [_build_srepr(arg) for arg in node.args]
+            try:
+                return func(*args)
+            except Exception as e:
+                raise ValueError("Invalid arguments in srepr expression : %s" % ast.unparse(node)) from e
+
+    raise ValueError("Unexpected node in srepr expression : %s" % ast.dump(node))
+
+def _parse_srepr(expr_str):
+    """
+    Parse an expression exported with srepr. Its syntax tree is checked against a whitelist of sympy classes and constants,
+    and built directly : it is never evaluated as python code. Raises ValueError for anything else
+    """
+    try:
+        expr = _build_srepr(ast.parse(expr_str, mode="eval").body)
+    except (SyntaxError, RecursionError, MemoryError) as e:
+        raise ValueError("Invalid srepr expression") from e
+    if not isinstance(expr, Basic):
+        raise ValueError("Not a sympy expression : %s" % expr_str)
+    return expr
+
+# Parsers of expressions, by format of lambdas in json.
+# None : legacy files, exported with str. The sympy parser evaluates them as python code : only load trusted ones
+_EXPR_PARSERS = {
+    "srepr": _parse_srepr,
+    None: parse_expr}
+
+# Incremented when params are created or their defaults modified, to refresh default values precomputed from them
+_param_versions = itertools.count()
+_params_version = next(_param_versions)
+
+def _params_modified():
+    global _params_version
+    _params_version = next(_param_versions)
+
 class Lambda:
     """
     This class represents a compiled (lambdified) expression together with the list of requirement parameters and the source expression
     """
-    def __init__(self, expr, all_params):
 
-        if isinstance(expr, dict):
+    __slots__ = ("lambd", "params", "_params_set", "expr", "_expanded_param_order", "_positions", "_all_params", "_args_index", "_vec", "_se_lam")
+
+    def __init__(self, expr, all_params, expanded_params_map=None):
+        """
+        :param expr: Expression, or dict of expressions
+        :param all_params: Dict of all parameters
+        :param expanded_params_map: Optional dict of expanded param name => param name, as built by build_expanded_params_map(). Pass it when building many lambdas
+        """
 
-            self.lambd = dict()
+        if isinstance(expr, dict):
 
             # First, gather all expanded parameters
             all_expanded_params = set()
@@ -45,72 +357,216 @@ class Lambda:
             all_expanded_params = list(all_expanded_params)
 
             # Transform them into list of params
-            self.params = unexpand_param_names(all_params, all_expanded_params)
+            self.params = tuple(unexpand_param_names(all_params, all_expanded_params, expanded_params_map))
             reexpanded_params = expand_param_names(all_params, self.params)
 
-            # Lambdify with all expanded params
-            for key, sub_expr in expr.items():
-                self.lambd[key] = _lambdify(sub_expr, reexpanded_params)
+            # Compile all of them at once, with symengine if available.
+            # Otherwise, fuse them in a single function returning a tuple, sharing common sub expressions
+            self._se_lam = _se_lambdify(expr.values(), reexpanded_params)
+            if self._se_lam is None:
+                self.lambd = _compile(sympy.Tuple(*expr.values()), reexpanded_params)
+            else:
+                self.lambd = None
 
         else:
             if not isinstance(expr, Expr):
                 expr = Float(expr)
 
             expanded_params = list(str(symbol) for symbol in expr.free_symbols)
-            self.params = unexpand_param_names(all_params, expanded_params)
+            self.params = tuple(unexpand_param_names(all_params, expanded_params, expanded_params_map))
 
             # Reexpend symbols, to ensure all enum values are present as a parameter
             reexpanded_params = expand_param_names(all_params, self.params)
 
-            self.lambd = _lambdify(expr, reexpanded_params)
+            self.lambd = _compile(expr, reexpanded_params)
+            self._se_lam = None
 
         self.expr = expr
 
+        # For O(1) membership tests
+        self._params_set = frozenset(self.params)
+
+        # Positional order of the arguments of the lambdified function(s)
+        self._expanded_param_order = reexpanded_params
+
+        self._positions = {name: idx for idx, name in enumerate(reexpanded_params)}
+
+        # Default values of positional arguments and positions of params, precomputed for the dict the lambda was built with.
+        # Rebuilt when its params or their defaults change
+        self._all_params = all_params
+        self._args_index = self._build_args_index(all_params)
+
+        # Lambdified and vectorized functions, built on first use of evaluate_vectorized
+        self._vec = dict()
+
+    def _build_args_index(self, all_params):
+        """
+        :return: <Version of params they are read from>,
+            <Default values of positional arguments>,
+            <Dict of param name => (param, positions of its expanded names), to override them>
+        """
+        # Read first : params modified meanwhile trigger a new build
+        version = _params_version
+        params = [all_params[param_name] for param_name in self.params]
+
+        # Enum values unknown to the compiled function are ignored, as values unknown to the enum
+        override_index = {
+            param_name: (param, [(name, self._positions[name]) for name in param.expand_names() if name in self._positions])
+            for param_name, param in zip(self.params, params)}
+
+        # Enum values missing from the params are never selected
+        default_args = [0] * len(self._positions)
+        for param, index in override_index.values():
+            expanded_values = param.expand_values(param.default)
+            for name, position in index:
+                default_args[position] = expanded_values[name]
+
+        return version, default_args, override_index
+
+    def _get_args_index(self, all_params):
+        """Precomputed args index for the dict of params the lambda was built with, if still valid. Built from all_params otherwise"""
+
+        args_index = self._args_index
+        if all_params is self._all_params and args_index[0] == _params_version:
+            return args_index
+
+        args_index = self._build_args_index(all_params)
+        if all_params is self._all_params:
+            # Params created or defaults modified since
+            self._args_index = args_index
+        return args_index
+
+    def _positional_args(self, all_params, param_values, vectorized=False):
+        """Positional arguments : default values, overridden by the given values, expanded"""
+
+        _, default_args, override_index = self._get_args_index(all_params)
+        args = default_args.copy()
+
+        for param_name, val in param_values.items():
+            index = override_index.get(param_name)
+            if index is None:
+                continue
+            # Param of all_params : the index was built from it
+            param, positions = index
+            expanded_values = param.expand_array_values(val) if vectorized else param.expand_values(val)
+            for name, position in positions:
+                args[position] = expanded_values[name]
+
+        return args
+
     def evaluate(self, all_params, param_values):
+        """
+        Evaluate the expression for single values of parameters.
+        Arrays of values are supported as well, through evaluate_vectorized (slower)
+        :param all_params: Dict of all parameters, for their default values
+        """
+        # Compiled functions only accept scalars : fallback for arrays. Other invalid values raise
+        if any(isinstance(val, (list, tuple, np.ndarray)) for val in param_values.values()):
+            return self.evaluate_vectorized(all_params, param_values)
+
+        args = self._positional_args(all_params, param_values)
+
+        if self._se_lam is not None :
+            out = np.empty(len(self.expr))
+            self._se_lam(args, out=out)
+            return dict(zip(self.expr.keys(), out.tolist()))
+        elif isinstance(self.expr, dict) :
+            return dict(zip(self.expr.keys(), self.lambd(*args)))
+        else:
+            return self.lambd(*args)
 
-        # First, set default values
-        values = {key: all_params[key].default for key in self.params}
+    def param_key(self, param_values, all_params=None):
+        """
+        Hashable key of the values of the params of this lambda, for memoization
+        :param all_params: Dict of all parameters. If provided, the key includes their defaults, or the version of them
+        """
+        key = tuple(sorted((key, val) for key, val in param_values.items() if key in self._params_set))
+        if all_params is None:
+            return key
+        if all_params is self._all_params:
+            return key, _params_version
+        return key, tuple((param_name, all_params[param_name].default) for param_name in self.params)
+
+    def evaluate_vectorized(self, all_params, param_arrays):
+        """
+        Evaluate the expression over arrays of parameter values (parameter sweep)
+        :param param_arrays: Dict of param name => single value or array of values. All values are broadcast together
+        :return: Array of values, or dict of arrays
+        """
 
-        # Override with actual values
-        values.update({key: val for key, val in param_values.items() if key in self.params})
+        args = self._positional_args(all_params, param_arrays, vectorized=True)
 
-        # Expand
-        expanded_values = dict()
-        for param_name, val in values.items():
-            param = all_params[param_name]
-            expanded_values.update(param.expand_values(val))
+        # Broadcast them together, with the arrays of params not used by this expression : results have the shape of the sweep
+        shape = np.broadcast_shapes(*(np.shape(val) for val in param_arrays.values()), *(np.shape(arg) for arg in args))
+        args = [np.broadcast_to(np.asarray(arg, dtype=np.float64), shape) for arg in args]
 
+        if self._se_lam is not None :
+            # Symengine evaluates a stack of input vectors at once
+            out = self._se_lam(np.stack(args, axis=-1)).reshape(shape + (len(self.expr),))
+            return {key: out[..., idx] for idx, key in enumerate(self.expr.keys())}
 
-        if isinstance(self.lambd, dict) :
-            return {key: lambd(**expanded_values) for key, lambd in self.lambd.items()}
+        def evaluate_one(key, expr, lambd=None):
+            # Ufuncs return a single value : lambdify each expression on its own
+            if not key in self._vec:
+                if lambd is None:
+                    lambd = _lambdify(expr, self._expanded_param_order)
+                self._vec[key] = (lambd, _vectorize(lambd, len(args)))
+            lambd, vec = self._vec[key]
+
+            if vec is not None:
+                res = vec(*args)
+            else:
+                # Fallback to numpy : lambdified python functions support arrays
+                res = getattr(lambd, "py_func", lambd)(*args)
+
+            return np.broadcast_to(np.asarray(res, dtype=np.float64), shape)
+
+        if isinstance(self.expr, dict) :
+            return {key: evaluate_one(key, expr) for key, expr in self.expr.items()}
         else:
-            return self.lambd(**expanded_values)
+            return evaluate_one(None, self.expr, self.lambd)
 
 
     def __json__(self):
 
+        # srepr is longer than str, but much faster to parse back
         if isinstance(self.expr, dict):
-            expr = {key: str(expr) for key, expr in self.expr.items()}
+            expr = {key: srepr(expr) for key, expr in self.expr.items()}
         else:
-            expr = str(self.expr)
+            expr = srepr(self.expr)
 
         return dict(
+            format="srepr",
             params=self.params,
             expr=expr)
 
     @classmethod
-    def from_json(cls, js, all_params):
+    def from_json(cls, js, all_params, expanded_params_map=None):
+
+        expr_format = js.get("format")
+        if not expr_format in _EXPR_PARSERS:
+            raise ValueError("Unknown format of expressions '%s'. Expected one of %s" % (expr_format, list(_EXPR_PARSERS.keys())))
+        parse = _EXPR_PARSERS[expr_format]
+
         expr = js["expr"]
         if isinstance(expr, dict):
-            expr = {key:parse_expr(expr) for key, expr in expr.items()}
+            expr = {key:parse(expr) for key, expr in expr.items()}
         else:
-            expr = parse_expr(expr)
+            expr = parse(expr)
 
-        return cls(expr=expr, all_params=all_params)
+        return cls(expr=expr, all_params=all_params, expanded_params_map=expanded_params_map)
 
 
 class Param:
 
+    # Exported fields
+    _FIELDS = ("name", "label", "type", "default", "unit", "group", "description", "values", "min", "max")
+
+    __slots__ = (
+        "name", "label", "type", "_default", "unit", "group", "description",
+        "values", "min", "max",
+        "_is_enum", "_expanded_names", "_zero_values", "_expanded_values")
+
     def __init__(
             self, name, type:ParamType, unit:str, default:float,
             values:List[str]=None,
@@ -132,29 +588,65 @@ class Param:
             self.min = min
             self.max = max
 
+        # Checked in each evaluation
+        self._is_enum = self.type == ParamType.ENUM
+
+        if self._is_enum :
+            # Precompute expanded names and values, used in each evaluation
+            self._expanded_names = ["%s_%s" % (self.name, enum) for enum in self.values]
+            self._zero_values = {name: 0 for name in self._expanded_names}
+            self._expanded_values = {
+                enum: {**self._zero_values, expanded_name: 1}
+                for enum, expanded_name in zip(self.values, self._expanded_names)}
+
+        # Params of a dict may have been replaced
+        _params_modified()
+
+    @property
+    def default(self):
+        return self._default
+
+    @default.setter
+    def default(self, value):
+        self._default = value
+        _params_modified()
+
     @classmethod
     def from_json(cls, js):
         return cls(**js)
 
     def expand_values(self, value):
+        """Returns a dict of expanded name => value. It is shared and should not be modified"""
 
         # Simple case
-        if self.type != ParamType.ENUM :
+        if not self._is_enum :
             return {self.name:value}
 
-        # Enum ? generate individual boolean param values
-        return {"%s_%s" % (self.name, enum): 1 if value == enum else 0 for enum in self.values}
+        # Enum ? individual boolean param values, all zero for unknown values
+        return self._expanded_values.get(value, self._zero_values)
+
+    def expand_array_values(self, values):
+        """Same as expand_values, for a single value or an array of values"""
+
+        if not self._is_enum :
+            return {self.name:values}
+
+        values = np.asarray(values)
+        return {
+            expanded_name: (values == enum).astype(np.float64)
+            for enum, expanded_name in zip(self.values, self._expanded_names)}
 
     def expand_names(self):
 
-        if self.type != ParamType.ENUM :
+        if not self._is_enum :
             return [self.name]
 
-        # Enum ? generate individual boolean param values
-        return ["%s_%s" % (self.name, enum) for enum in self.values]
+        # Enum ? individual boolean param names
+        return self._expanded_names
 
     def __json__(self):
-        return self.__dict__
+        # Skip precomputed and unset attributes
+        return {key: getattr(self, key) for key in self._FIELDS if hasattr(self, key)}
 
 
 def expand_param_names(all_params, param_names):
@@ -165,18 +657,34 @@ def expand_param_names(all_params, param_names):
     return res
 
 
-def unexpand_param_names(all_params, expanded_param_names):
+def build_expanded_params_map(all_params):
     """Build a dict of expended_param => param"""
-    expanded_params_to_params = {name:param.name for param in all_params.values() for name in param.expand_names() }
-    return list(set(expanded_params_to_params[name] for name in expanded_param_names))
+    return {name:param.name for param in all_params.values() for name in param.expand_names() }
+
+
+def unexpand_param_names(all_params, expanded_param_names, expanded_params_map=None):
+    """
+    Transform expanded param names into the list of their params
+    :param expanded_params_map: Reverse map, built from all_params if not provided
+    :return: Sorted list of param names, so that identical expressions get the same positional params
+    """
+    if expanded_params_map is None :
+        expanded_params_map = build_expanded_params_map(all_params)
+    return sorted(set(expanded_params_map[name] for name in expanded_param_names))
 
 
 class Impact() :
+
+    __slots__ = ("name", "unit")
+
     def __init__(self, name, unit):
         self.name = name,
         self.unit = unit
 
 
+# Max number of evaluations memorized by a model (LRU)
+EVAL_CACHE_SIZE = 1024
+
 class Model :
 
     def __init__(
@@ -196,8 +704,18 @@ class Model :
         self.functional_units : Dict[str, FunctionalUnit] = functional_units
         self.impacts: Dict[str, Impact] = impacts
 
+        # LRU memo of evaluated lambdas, by (tagged name, values of their own params).
+        # The model may be shared between threads (streamlit sessions)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        # Memo of specialized lambdas, by (impact, functional unit, axis), and reverse map of params to build them
+        self._specialized = dict()
+        self._expanded_params_map = build_expanded_params_map(params)
+
     def __json__(self):
-        return self.__dict__
+        # Skip evaluation cache
+        return {key: val for key, val in self.__dict__.items() if not key.startswith("_")}
 
     def evaluate(self, impact, functional_unit, axis="total", **param_values):
         """
@@ -208,6 +726,100 @@ class Model :
         :return: <Value of impact, or dict of values, in case one axis is used>, <unit>
         """
 
+        fu_name = functional_unit
+        lambd, functional_unit, unit = self._resolve(impact, functional_unit, axis)
+
+        # Compute value of functional unit. As numpy float : division by zero gives inf, as in compiled functions
+        fu_val = np.float64(self._evaluate_cached(("fu", fu_name), functional_unit.quantity, param_values))
+
+        # Compute value of impacts
+        impacts = self._evaluate_cached(("impact", axis, impact), lambd, param_values)
+
+        # Divide the two
+        if isinstance(impacts, dict) :
+            vals = {key: val / fu_val for key, val in impacts.items()}
+        else:
+            vals = impacts / fu_val
+
+        return vals, unit
+
+    def evaluate_batch(self, impact, functional_unit, axis="total", **param_values):
+        """
+        Same as evaluate, for parameter sweeps.
+        :param param_values: Single values or arrays of values, broadcast together
+        :return: <Array of values of impact, or dict of arrays, in case one axis is used>, <unit>
+        """
+
+        lambd, functional_unit, unit = self._resolve(impact, functional_unit, axis)
+
+        fu_val = functional_unit.quantity.evaluate_vectorized(self.params, param_values)
+        impacts = lambd.evaluate_vectorized(self.params, param_values)
+
+        if isinstance(impacts, dict) :
+            vals = {key: val / fu_val for key, val in impacts.items()}
+        else:
+            vals = impacts / fu_val
+
+        return vals, unit
+
+    def specialize(self, impact, functional_unit, axis="total"):
+        """
+        Resolve impact, functional unit and axis once, and compile impact / functional unit as a single expression.
+        Use it for many evaluations of the same impact :
+
+        >>> lambd, unit = model.specialize("climate_change", "energy")
+        >>> val = lambd.evaluate(model.params, dict(n_turbines=2))
+
+        :return: <Lambda of the value of impact (or dict of values) by functional unit>, <unit>
+        """
+
+        key = (impact, functional_unit, axis)
+        if key in self._specialized:
+            return self._specialized[key]
+
+        lambd, functional_unit, unit = self._resolve(impact, functional_unit, axis)
+        fu_expr = functional_unit.quantity.expr
+
+        if isinstance(lambd.expr, dict) :
+            expr = {key: sub_expr / fu_expr for key, sub_expr in lambd.expr.items()}
+        else:
+            expr = lambd.expr / fu_expr
+
+        res = self._specialized[key] = Lambda(expr, self.params, self._expanded_params_map), unit
+        return res
+
+    def _evaluate_cached(self, name, lambd, param_values):
+        """
+        Evaluate a lambda, or reuse its value if its own params did not change.
+        Least recently used values are dropped beyond EVAL_CACHE_SIZE
+        """
+
+        try:
+            key = (name, lambd.param_key(param_values, self.params))
+            hash(key)
+        except TypeError:
+            # Unhashable values
+            return lambd.evaluate(self.params, param_values)
+
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        # Evaluated out of the lock : concurrent misses may compute the same value twice
+        res = lambd.evaluate(self.params, param_values)
+
+        with self._cache_lock:
+            self._cache[key] = res
+            self._cache.move_to_end(key)
+            while len(self._cache) > EVAL_CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+        return res
+
+    def _resolve(self, impact, functional_unit, axis):
+        """Check and return lambda of impact, functional unit and unit"""
+
         if not axis in self.expressions :
             raise Exception("Wrong axis '%s'. Expected one of %s" % (axis, list(self.expressions.keys())))
 
@@ -220,40 +832,29 @@ class Model :
         impact_obj = self.impacts[impact]
         functional_unit = self.functional_units[functional_unit]
 
-        # Compute value of functional unit
-        fu_val = functional_unit.quantity.evaluate(self.params, param_values)
-
-        # Compute value of impacts
-        impacts = lambd.evaluate(self.params, param_values)
-
         unit = impact_obj.unit
 
         if functional_unit.unit is not None :
             unit += "/" + functional_unit.unit
 
-        # Divide the two
-        if isinstance(impacts, dict) :
-            vals = {key: val / fu_val for key, val in impacts.items()}
-        else:
-            vals = impacts / fu_val
-
-        return vals, unit
+        return lambd, functional_unit, unit
 
 
     @classmethod
     def from_json(cls, js) :
 
         all_params = {key: Param.from_json(val) for key, val in js["params"].items()}
+        expanded_params_map = build_expanded_params_map(all_params)
 
         expressions = {
             axis : {
-                method: Lambda.from_json(lambd, all_params)
+                method: Lambda.from_json(lambd, all_params, expanded_params_map)
                 for method, lambd in impacts.items()}
             for axis, impacts in js["expressions"].items()}
 
         functional_units = {
             key: FunctionalUnit(
-                quantity=Lambda.from_json(fu["quantity"], all_params),
+                quantity=Lambda.from_json(fu["quantity"], all_params, expanded_params_map),
                 unit=fu["unit"])
 
             for key, fu in js["functional_units"].items()}
@@ -279,17 +880,57 @@ class Model :
 
 
 
-def serialize_model(obj) :
-    if isinstance(obj, dict) :
-        return {key: serialize_model(val) for key, val in obj.items()}
+def _object_fields(obj):
+    """Attributes of an object, with or without __slots__"""
+    if hasattr(obj, "__dict__") :
+        return obj.__dict__
+    return {key: getattr(obj, key) for key in obj.__slots__ if hasattr(obj, key)}
 
-    if hasattr(obj, "__json__") :
-        return serialize_model(obj.__json__())
 
-    if hasattr(obj, "__dict__") :
-        return serialize_model(obj.__dict__)
+def _serialize_dict(parent, key, obj, stack):
+    # Preallocate keys, to keep their order
+    parent[key] = out = dict.fromkeys(obj)
+    stack.extend((out, sub_key, val) for sub_key, val in obj.items())
+
+def _serialize_json(parent, key, obj, stack):
+    stack.append((parent, key, obj.__json__()))
+
+def _serialize_fields(parent, key, obj, stack):
+    stack.append((parent, key, _object_fields(obj)))
 
-    return obj
+def _serialize_leaf(parent, key, obj, stack):
+    parent[key] = obj
+
+
+# Serialization handler by type, resolved on first encounter
+_SERIALIZE_HANDLERS = dict()
+
+def _serialize_handler(obj):
+    cls = type(obj)
+    handler = _SERIALIZE_HANDLERS.get(cls)
+
+    if handler is None :
+        if isinstance(obj, dict) :
+            handler = _serialize_dict
+        elif hasattr(obj, "__json__") :
+            handler = _serialize_json
+        elif hasattr(obj, "__dict__") or hasattr(obj, "__slots__") :
+            handler = _serialize_fields
+        else:
+            handler = _serialize_leaf
+        _SERIALIZE_HANDLERS[cls] = handler
+
+    return handler
+
+
+def serialize_model(obj) :
+    """Transform a model into plain dicts, ready for JSON. Iterative, to avoid deep recursion"""
 
+    root = [None]
+    stack = deque([(root, 0, obj)])
 
+    while stack :
+        parent, key, obj = stack.pop()
+        _serialize_handler(obj)(parent, key, obj, stack)
 
+    return root[0]
@@ -1,18 +1,38 @@
 
 from typing import Dict
+from mpmath.libmp import dps_to_prec
+from sympy import Basic, Float
 from lca_algebraic import SymDict, ParamDef
 from lca_algebraic.base_utils import _method_unit
 from lca_algebraic.lca import _preMultiLCAAlgebric
 from lca_algebraic.params import _param_registry
-from lca_algebraic.stats import _round_expr
-from lib.common import FunctionalUnit, Lambda, Impact, Model, Param
+from lib.common import FunctionalUnit, Lambda, Impact, Model, Param, build_expanded_params_map
 
 
 def round_expr(exp_or_dict, num_digits):
+    """
+    Round all floats of an expression (or dict of expressions) to num_digits significant digits.
+    Floats are gathered and rounded once for all sub expressions. Those already rounded are left untouched
+    """
+    exprs = exp_or_dict.values() if isinstance(exp_or_dict, dict) else [exp_or_dict]
+
+    prec = dps_to_prec(num_digits)
+    replacements = dict()
+    for expr in exprs:
+        if isinstance(expr, Basic):
+            for num in expr.atoms(Float):
+                if num._prec != prec and not num in replacements:
+                    replacements[num] = Float(num, num_digits)
+
+    def _round(expr):
+        if not replacements or not isinstance(expr, Basic):
+            return expr
+        return expr.xreplace(replacements)
+
     if isinstance(exp_or_dict, dict) :
-        return dict({key: _round_expr(val, num_digits) for key, val in exp_or_dict.items()})
+        return dict({key: _round(val) for key, val in exp_or_dict.items()})
     else:
-        return _round_expr(exp_or_dict, num_digits)
+        return _round(exp_or_dict)
 
 def paramDef_to_param(paramDef:ParamDef):
     return Param(
@@ -47,6 +67,7 @@ def export_lca(
 
     # Transform all lca_algebraic parameters to exported ones
     all_params = {param.name: paramDef_to_param(param) for param in _param_registry().all()}
+    expanded_params_map = build_expanded_params_map(all_params)
 
     impacts_by_axis = dict()
 
@@ -70,13 +91,13 @@ def export_lca(
 
         # Save
         impacts_by_axis[axis] = {
-            method: Lambda(lambd.expr, all_params)
+            method: Lambda(lambd.expr, all_params, expanded_params_map)
             for method, lambd in zip(methods_dict.keys(), lambdas)}
 
     # Dict of functional units
     functional_units = {
         name: FunctionalUnit(
-            quantity=Lambda(fu["quantity"], all_params),
+            quantity=Lambda(fu["quantity"], all_params, expanded_params_map),
             unit=fu["unit"])
         for name, fu in functional_units.items()}
 
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Add root dir of the repository to PATH, for "lib"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
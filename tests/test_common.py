@@ -0,0 +1,270 @@
+import numpy as np
+import pytest
+from sympy import Float, Function, Integer, Piecewise, Pow, Rational, Symbol, oo, srepr
+
+import lib.common
+from lib.common import FunctionalUnit, Impact, Lambda, Model, Param, ParamType, _parse_srepr
+
+x = Symbol("x")
+y = Symbol("y")
+
+# Expanded symbols of enum param "e"
+e_a = Symbol("e_a")
+e_b = Symbol("e_b")
+
+PARAMS = {
+    "x": Param("x", ParamType.FLOAT, "", 2.0),
+    "y": Param("y", ParamType.FLOAT, "", 3.0),
+    "e": Param("e", ParamType.ENUM, "", "a", values=["a", "b"]),
+    # Used by no expression
+    "z": Param("z", ParamType.FLOAT, "", 1.0)}
+
+
+def _copy_params():
+    return {key: Param.from_json(param.__json__()) for key, param in PARAMS.items()}
+
+
+def _model(params=PARAMS):
+    return Model(
+        params=params,
+        expressions=dict(
+            total=dict(impact=Lambda(x * y + 2 * e_a + 3 * e_b, params)),
+            phase=dict(impact=Lambda(dict(p1=2 * x, p2=e_b * y, p3=Integer(1)), params))),
+        functional_units=dict(
+            energy=FunctionalUnit(Lambda(y + 1, params), "kWh"),
+            system=FunctionalUnit(Lambda(Integer(2), params), None)),
+        impacts=dict(impact=Impact("impact", "kg")))
+
+
+def test_rounded_floats_symengine_vs_lambdify(monkeypatch):
+    pytest.importorskip("symengine")
+
+    expr = {
+        "a": Float(7.777777, 3) * x,
+        "b": Float(0.001234567, 3) + y,
+        "c": Float(0.001234567, 3)}
+
+    se_lambd = Lambda(expr, PARAMS)
+    assert se_lambd._se_lam is not None
+
+    monkeypatch.setattr(lib.common, "symengine", None)
+    lambd = Lambda(expr, PARAMS)
+
+    values = dict(x=1.0, y=0.5)
+    assert se_lambd.evaluate(PARAMS, values) == pytest.approx(lambd.evaluate(PARAMS, values), rel=1e-12)
+    assert se_lambd.evaluate(PARAMS, values) == pytest.approx(dict(a=7.78, b=0.50123, c=0.00123), rel=1e-12)
+
+
+@pytest.fixture(params=["numba", "python"])
+def backend(request, monkeypatch):
+    """Compile with numba, or run lambdified functions as plain python"""
+    if request.param == "numba":
+        pytest.importorskip("numba")
+    else:
+        monkeypatch.setattr(lib.common, "njit", None)
+    monkeypatch.setattr(lib.common, "_COMPILED_CACHE", dict())
+    return request.param
+
+
+@pytest.mark.parametrize("expr", [
+    y / x,
+    y * x ** -1,
+    # Not compiled by numba : always run as python
+    Piecewise((y / x, x < 1), (y, True))])
+def test_division_by_zero(backend, expr):
+    lambd = Lambda(expr, PARAMS)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        assert lambd.evaluate(PARAMS, dict(x=0.0)) == np.inf
+        assert np.isnan(lambd.evaluate(PARAMS, dict(x=0.0, y=0.0)))
+
+
+def test_evaluate_zero_functional_unit(backend):
+    model = Model(
+        params=PARAMS,
+        expressions=dict(total=dict(impact=Lambda(y * 2, PARAMS))),
+        functional_units=dict(fu=FunctionalUnit(Lambda(x, PARAMS), "kWh")),
+        impacts=dict(impact=Impact("impact", "kg")))
+
+    with np.errstate(divide="ignore"):
+        val, unit = model.evaluate("impact", "fu", x=0.0)
+        assert val == np.inf
+        assert unit == "kg/kWh"
+
+        vals, _ = model.evaluate_batch("impact", "fu", x=np.array([0.0, 2.0]))
+        assert list(vals) == [np.inf, 3.0]
+
+
+@pytest.mark.parametrize("param_values", [
+    # Scalar / array mix
+    dict(x=np.array([0.5, 1.0, 4.0]), y=2.0),
+    # Broadcast together
+    dict(x=np.array([[0.5], [1.0]]), y=np.array([1.0, 2.0, 3.0])),
+    # Enum arrays
+    dict(e=np.array(["a", "b", "b", "c"]), y=np.linspace(0, 1, 4)),
+    # Params unused by some or all expressions
+    dict(z=np.linspace(0, 1, 5)),
+    dict(e=np.array(["a", "b"])),
+    dict(x=np.linspace(0, 1, 5))])
+@pytest.mark.parametrize("axis", ["total", "phase"])
+@pytest.mark.parametrize("functional_unit", ["energy", "system"])
+def test_evaluate_batch(axis, functional_unit, param_values):
+    model = _model()
+    shape = np.broadcast_shapes(*(np.shape(val) for val in param_values.values()))
+
+    vals, unit = model.evaluate_batch("impact", functional_unit, axis, **param_values)
+    assert unit == model.evaluate("impact", functional_unit, axis)[1]
+
+    for idx in np.ndindex(shape):
+        values = {key: np.broadcast_to(val, shape)[idx].item() for key, val in param_values.items()}
+        expected, _ = model.evaluate("impact", functional_unit, axis, **values)
+
+        if axis == "phase":
+            assert vals.keys() == expected.keys()
+            for key, val in vals.items():
+                assert val.shape == shape
+                assert val.dtype == np.float64
+                assert val[idx] == pytest.approx(expected[key])
+        else:
+            assert vals.shape == shape
+            assert vals.dtype == np.float64
+            assert vals[idx] == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("param_values", [
+    dict(),
+    dict(x=0.5, y=4.0),
+    dict(e="b"),
+    dict(e="b", y=0.5),
+    dict(e="c", z=3.0)])
+@pytest.mark.parametrize("axis", ["total", "phase"])
+@pytest.mark.parametrize("functional_unit", ["energy", "system"])
+def test_specialize(axis, functional_unit, param_values):
+    model = _model()
+
+    lambd, unit = model.specialize("impact", functional_unit, axis)
+    expected, expected_unit = model.evaluate("impact", functional_unit, axis, **param_values)
+
+    assert unit == expected_unit
+    assert lambd.evaluate(model.params, param_values) == pytest.approx(expected)
+
+    # Memoized
+    assert model.specialize("impact", functional_unit, axis)[0] is lambd
+
+
+def test_defaults_modified_in_place():
+    params = _copy_params()
+    model = _model(params)
+    assert model.evaluate("impact", "energy")[0] == pytest.approx((2 * 3 + 2) / 4)
+
+    params["x"].default = 5.0
+    params["e"].default = "b"
+    assert model.evaluate("impact", "energy")[0] == pytest.approx((5 * 3 + 3) / 4)
+
+    params["y"] = Param("y", ParamType.FLOAT, "", 1.0)
+    assert model.evaluate("impact", "energy")[0] == pytest.approx((5 * 1 + 3) / 2)
+    assert model.evaluate("impact", "energy", x=1.0)[0] == pytest.approx((1 * 1 + 3) / 2)
+
+
+def test_evaluate_other_params():
+    lambd = Lambda(x * y + 2 * e_a + 3 * e_b, PARAMS)
+    assert lambd.evaluate(PARAMS, {}) == pytest.approx(8.0)
+
+    params = _copy_params()
+    params["x"].default = 10.0
+    assert lambd.evaluate(params, {}) == pytest.approx(32.0)
+    assert lambd.evaluate(PARAMS, {}) == pytest.approx(8.0)
+
+    # Other enum values
+    params["e"] = Param("e", ParamType.ENUM, "", "c", values=["a", "b", "c"])
+    assert lambd.evaluate(params, {}) == pytest.approx(30.0)
+    assert lambd.evaluate(params, dict(e="b")) == pytest.approx(33.0)
+
+    params["e"] = Param("e", ParamType.ENUM, "", "b", values=["b"])
+    assert lambd.evaluate(params, {}) == pytest.approx(33.0)
+    assert lambd.evaluate(params, dict(e="a")) == pytest.approx(30.0)
+
+    vals = lambd.evaluate_vectorized(params, dict(e=np.array(["a", "b"])))
+    assert list(vals) == pytest.approx([30.0, 33.0])
+
+
+def test_rounded_constant():
+    assert Lambda(Float(7.777777, 3), PARAMS).evaluate(PARAMS, {}) == 7.78
+
+
+@pytest.mark.parametrize("expr_str", [
+    "Symbol('x').__class__",
+    "__import__('os').system('true')",
+    "sympify('x + 1')",
+    "lambdify(Symbol('x'), Symbol('x'))",
+    "Integer('1 + 1')",
+    "Add(Symbol('x'), 'x')",
+    "Symbol(x='x')",
+    "[Symbol('x')]",
+    "'x'"])
+def test_parse_srepr_rejects(expr_str):
+    with pytest.raises(ValueError, match="Unexpected node"):
+        _parse_srepr(expr_str)
+
+
+@pytest.mark.parametrize("expr_str", [
+    # Constructor failures
+    "Symbol(1)",
+    "Function('f')(Symbol('x'), y=Integer(1))",
+    # Number theory / combinatorics
+    "factorial(Integer(100000000))",
+    "gamma(Integer(100000000))",
+    "Derivative(Pow(Symbol('x'), Integer(2)), Tuple(Symbol('x'), Integer(100000000)))",
+    # Too large numbers
+    "Integer(10000000000000000000000)",
+    "Integer(-10000000000000000000000)",
+    "Pow(Integer(7), Integer(30000000))",
+    "Pow(7, 30000000)",
+    "Pow(Pow(Integer(2), Integer(1000)), Integer(1000))",
+    "Pow(Rational(1, 3), Integer(-30000000))",
+    "Float('1.5', precision=100000000)",
+    "Float('1.5', 100000000)",
+    # Invalid syntax
+    "Add(Symbol('x'),",
+    "Integer(%s)" % ("9" * 5000)])
+def test_parse_srepr_rejects_invalid(expr_str):
+    with pytest.raises(ValueError):
+        _parse_srepr(expr_str)
+
+
+@pytest.mark.parametrize("expr", [
+    Pow(Integer(2), Rational(1, 2)),
+    Pow(x, Integer(30000000)),
+    Pow(Float(1.5), Integer(30000000)),
+    Piecewise((x, x > 0), (Float(7.777777, 3), True)),
+    Function('f')(x, y),
+    -oo,
+    x * -oo,
+    Float(7.777777, 3) * x + y ** 2])
+def test_parse_srepr_round_trip(expr):
+    parsed = _parse_srepr(srepr(expr))
+    assert parsed == expr
+    assert srepr(parsed) == srepr(expr)
+
+
+def test_parse_srepr_keeps_precision():
+    parsed = _parse_srepr("Float('7.77734', precision=13)")
+    assert parsed == Float(7.777777, 3)
+    assert parsed._prec == 13
+
+
+def test_lambda_from_json_formats():
+    expr = Float(0.5, 3) * x + y
+
+    js = Lambda(expr, PARAMS).__json__()
+    assert js["format"] == "srepr"
+    assert Lambda.from_json(js, PARAMS).evaluate(PARAMS, {}) == pytest.approx(4.0)
+
+    # Legacy files, without format
+    legacy = Lambda.from_json(dict(params=["x", "y"], expr=str(expr)), PARAMS)
+    assert legacy.evaluate(PARAMS, {}) == pytest.approx(4.0)
+
+    dict_js = Lambda(dict(a=x, b=y), PARAMS).__json__()
+    assert Lambda.from_json(dict_js, PARAMS).evaluate(PARAMS, {}) == pytest.approx(dict(a=2.0, b=3.0))
+
+    with pytest.raises(ValueError, match="Unknown format"):
+        Lambda.from_json(dict(js, format="str"), PARAMS)